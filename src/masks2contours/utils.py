@@ -1,34 +1,117 @@
 
+import os
 from glob import glob
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from scipy.spatial.distance import cdist
-from scipy.spatial import KDTree
+from scipy.spatial import cKDTree
 import scipy.io as sio
-from shapely.geometry import Polygon
+
+VALVE_VARIABLE_NAMES = ("point_coords_mv", "point_coords_tv", "point_coords_av", "point_coords_pv")
+
+_EPS = np.finfo(np.float64).eps # The distance from 1 to the nearest number representible by the computer. I.e., is really small.
+
+# numba is optional. If it is available, the per-point loops below are compiled; otherwise the NumPy versions are used.
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+if HAS_NUMBA:
+    @njit('f8[::1](f8[:, ::1])', cache = True, fastmath = True, boundscheck = False)
+    def _pointDistances2DJit(points):
+        # Only for m x 2 points. Writing out both coordinates lets the compiler load and process them together.
+        numPts = points.shape[0]
+        distances = np.empty(numPts)
+        for i in range(numPts - 1):
+            dx = points[i + 1, 0] - points[i, 0]
+            dy = points[i + 1, 1] - points[i, 1]
+            distances[i] = np.sqrt(dx * dx + dy * dy)
+        if numPts > 0: # The last point is compared with the first point.
+            dx = points[0, 0] - points[numPts - 1, 0]
+            dy = points[0, 1] - points[numPts - 1, 1]
+            distances[numPts - 1] = np.sqrt(dx * dx + dy * dy)
+        return distances
+
+    @njit('f8[::1](f8[:, ::1], f8[::1])', cache = True, fastmath = True)
+    def _lineResidualsJit(tmp, coeff):
+        # Distance from each (centered) point in tmp to its projection onto the line through the origin with direction coeff.
+        numPts, numCols = tmp.shape
+        err = np.empty(numPts)
+        for i in range(numPts):
+            b = 0.0
+            for k in range(numCols):
+                b += tmp[i, k] * coeff[k]
+            total = 0.0
+            for k in range(numCols):
+                d = b * coeff[k] - tmp[i, k]
+                total += d * d
+            err[i] = np.sqrt(total)
+        return err
+
+    @njit('f8[:, ::1](f8[:, ::1], i8[:, ::1], b1)', cache = True, fastmath = True)
+    def _lineNormals2DJit(vertices, lineIndices, perpendicular):
+        # Same computation as the NumPy version in lineNormals2D, done in one pass over the lines and one pass over the
+        # vertices.
+        numVertices = vertices.shape[0]
+        D1 = np.zeros((numVertices, 2))
+        D2 = np.zeros((numVertices, 2))
+        for k in range(lineIndices.shape[0]):
+            i = lineIndices[k, 0]
+            j = lineIndices[k, 1]
+            dx = vertices[i, 0] - vertices[j, 0]
+            dy = vertices[i, 1] - vertices[j, 1]
+            LL2 = max(dx * dx + dy * dy, _EPS)
+            D1[i, 0] = dx / LL2
+            D1[i, 1] = dy / LL2
+            D2[j, 0] = dx / LL2
+            D2[j, 1] = dy / LL2
+
+        normals = np.empty((numVertices, 2))
+        for i in range(numVertices):
+            dx = D1[i, 0] + D2[i, 0]
+            dy = D1[i, 1] + D2[i, 1]
+            LL = max(np.sqrt(dx * dx + dy * dy), _EPS)
+            if perpendicular:
+                normals[i, 0] = -dy / LL
+                normals[i, 1] = dx / LL
+            else:
+                normals[i, 0] = dx / LL
+                normals[i, 1] = dy / LL
+        return normals
 
 def fitLine3D(points):
     '''
     Given "points", an m x 3 ndarray for some m, this function returns a 1 x n ndarray containing the residuals between
-    points on a line of best fit and the original points from "points". The best fit line is obtained with use of SVD.
+    points on a line of best fit and the original points from "points". The direction of the best fit line is the first
+    right singular vector of the centered points, obtained with np.linalg.eigh() on the 3 x 3 matrix tmp.T @ tmp.
     '''
 
-    # First, use SVD to compute coeff.
-    colMeans = np.array([np.mean(points[:, i]) for i in range(0, 2 + 1)]) # Compute mean of each col in points.
+    points = np.ascontiguousarray(points, dtype = np.float64)
+
+    # First, compute coeff, the first right singular vector of tmp.
+    colMeans = points.mean(axis = 0) # Compute mean of each col in points.
     tmp = points - colMeans # tmp is the result of subtracting colMeans from each row of points.
-    (u, s, vh) = np.linalg.svd(tmp)
 
-    # The matrices returned by the numpy SVD method seem to be transposes of those returned by the MATLAB SVD method.
-    # So we access vh[0, :] here rather than vh[:, 0].
-    coeff = vh[0, :]
+    # The right singular vectors of tmp are the eigenvectors of the 3 x 3 matrix tmp.T @ tmp, so there is no need for a
+    # full SVD of tmp. np.linalg.eigh() returns the eigenvalues in ascending order, so the last eigenvector is the one
+    # with the largest singular value. (Its sign may differ from the SVD one, which does not change the residuals).
+    (w, V) = np.linalg.eigh(tmp.T @ tmp)
+    coeff = V[:, -1]
 
     # Go backwards to calculate error.
-    b = (tmp @ coeff).transpose()
-    c = np.outer(coeff, b)
-    newPoints = c.transpose() + colMeans
+    if HAS_NUMBA:
+        return _lineResidualsJit(tmp, np.ascontiguousarray(coeff))
+
+    # newPoints - points is the same as (the projection of tmp onto the line) - tmp, since colMeans cancels out. Compute
+    # it in a single (m x 3, row-major) buffer.
+    b = tmp @ coeff
+    diff = np.multiply.outer(b, coeff)
+    diff -= tmp
 
     # Calculate err
-    err = [np.linalg.norm(newPoints[i, :] - points[i,:]) for i in range(0, points.shape[0])]
-    return np.array(err)
+    return np.sqrt(np.einsum('ij,ij->i', diff, diff))
 
 def lineNormals2D(vertices, lineIndices = None, perpendicular = False):
     '''
@@ -42,25 +125,38 @@ def lineNormals2D(vertices, lineIndices = None, perpendicular = False):
     This function was ported over from a MATLAB function written by D. Kroon from University of Twente in August 2011.
     '''
 
+    if vertices is None or (type(vertices) == np.ndarray and vertices.size == 0):
+        return np.empty((0, 2))
+
+    vertices = np.ascontiguousarray(vertices, dtype = np.float64)
     numVertices = vertices.shape[0]
 
-    if numVertices != 0 and numVertices < 2:
+    if numVertices < 2:
         raise ValueError("\"vertices\" must have either 0 rows or 2 or more rows; that is, there must be eiher 0 vertices or more than 2 vertices.")
 
-    if vertices is None or (type(vertices) == np.ndarray and vertices.size == 0):
-        return np.array([])
-
     # If nothing is passed in for "lines", initialize lines to the ndarray [[0, 1], [1, 2], ..., [numVertices - 2, numVertices - 1]].
     if lineIndices is None or (type(lineIndices) == np.ndarray and lineIndices.size == 0):
         lineIndices = np.column_stack((np.array(range(0, numVertices - 1)), np.array(range(1, (numVertices)))))
 
+    # The kernel only handles m x 2 vertices and integer indices; anything else goes through the NumPy path (which raises
+    # the appropriate errors for invalid input).
+    if HAS_NUMBA and vertices.ndim == 2 and vertices.shape[1] == 2 and np.issubdtype(np.asarray(lineIndices).dtype, np.integer):
+        # The kernel does not check its indices, so raise the same IndexError that NumPy indexing would.
+        lineIndices = np.ascontiguousarray(lineIndices, dtype = np.int64)
+        if lineIndices.ndim != 2 or lineIndices.shape[1] < 2:
+            raise IndexError("\"lineIndices\" must be a k x 2 ndarray.")
+        for index in (lineIndices[:, :2].min(), lineIndices[:, :2].max()):
+            if not -numVertices <= index < numVertices:
+                raise IndexError("index %d is out of bounds for axis 0 with size %d" % (index, numVertices))
+
+        return _lineNormals2DJit(vertices, lineIndices, bool(perpendicular))
+
     # Calculate tangent vectors.
     DT = vertices[lineIndices[:, 0], :] - vertices[lineIndices[:, 1], :]
 
     # Divide each tangent vector by its length. ("Weighted central difference"?)
-    LL = np.sqrt(np.power(DT[:, 0], 2) + np.power(DT[:, 1], 2))
-    eps = np.spacing(1) # Returns the distance from 1 to the nearest number representible by the computer. I.e., is really small.
-    LL2 = np.maximum(np.power(LL, 2), eps) # This is essentially the elementwise second power of LL.
+    LL = np.hypot(DT[:, 0], DT[:, 1])
+    LL2 = np.maximum(LL * LL, _EPS) # This is essentially the elementwise second power of LL.
     DT[:, 0] = np.divide(DT[:, 0], LL2) # The scaling happens in this line and the one below.
     DT[:, 1] = np.divide(DT[:, 1], LL2)
 
@@ -72,8 +168,8 @@ def lineNormals2D(vertices, lineIndices = None, perpendicular = False):
     D = D1 + D2
 
     # Normalize the normals.
-    LL = np.sqrt(np.power(D[:, 0], 2) + np.power(D[:, 1], 2))
-    LL = np.maximum(LL, eps) # The equivalent of this line was not in the MATLAB original, but is necessary to prevent division by zero ocurring as a result of division by too-small.
+    LL = np.hypot(D[:, 0], D[:, 1])
+    LL = np.maximum(LL, _EPS) # The equivalent of this line was not in the MATLAB original, but is necessary to prevent division by zero ocurring as a result of division by too-small.
     normals = np.zeros(D.shape) # Note that D.shape == vertices.shape.
 
     if perpendicular:
@@ -92,25 +188,28 @@ def getRVinsertIndices(points):
     Returns an 1 x m2 ndarray, for some m2, containing the indices of endoRVFWContours that correspond to the RV insert points.
     '''
 
+    if points.shape[0] < 2:
+        return np.empty((0,), dtype = np.intp)
+
     distances = pointDistances(points)
     upperThreshold = np.mean(distances) + 3 * np.std(distances, ddof = 1) # We need to use ddof = 1 to use Bessel's correction (so we need it to get the same std as is calculated in MATLAB).
-    largeDistExists = np.any(distances > upperThreshold)
 
-    # Find the index (in "distances") of the point that is furthest from its neighbor. Return an ndarray consisting of
-    # this point and *its* neighbor.
-    if largeDistExists != 0:
-        largestDistIndex = np.argmax(distances)
+    # Find the index (in "distances") of the point that is furthest from its neighbor. If that distance is large, return
+    # an ndarray consisting of this point and *its* neighbor.
+    largestDistIndex = np.argmax(distances)
+    if distances[largestDistIndex] > upperThreshold:
         if largestDistIndex == len(points) - 1: # if the point furthest from its neighbor is the last point...
-            return np.array([0, largestDistIndex]) #the neighbor to largestDistIndex is 0 in this case
+            return np.array([0, largestDistIndex], dtype = np.intp) #the neighbor to largestDistIndex is 0 in this case
         else:
-            return np.array([largestDistIndex, largestDistIndex + 1])
+            return np.array([largestDistIndex, largestDistIndex + 1], dtype = np.intp)
     else:
-        return np.array([])
+        return np.empty((0,), dtype = np.intp)
 
 
 def getLAinsert(inserts, sep_points):
-    tree = KDTree(sep_points)
-    dist, _ = tree.query(inserts)
+    # sep_points is small, so skip the extra work of building a balanced, compact tree.
+    tree = cKDTree(sep_points, balanced_tree = False, compact_nodes = False)
+    dist, _ = tree.query(np.atleast_2d(inserts), k = 1)
 
     return inserts[np.argmin(dist)]
 
@@ -141,15 +240,18 @@ def removeFarPoints(oldPoints):
     # Every point that is far from *both* of its neighbors is considered to be a "far point". We return the result
     # of removing all such far points from oldPoints.
     if np.size(far_indices) > 1: # Using > 1 instead of != 0 probably fixes some edge case.
-        indicesToRemove = []
-        for i in range(0, np.size(far_indices) - 1): # i covers the range {0, ..., np.size(far_indices) - 2} since np.size(far_indices) - 1 isn't included
-            if (far_indices[i] == 0) and (far_indices[-1] == np.size(oldPoints) - 1):
-                indicesToRemove.append(far_indices[i])
-            elif far_indices[i + 1] - far_indices[i] == 1:
-                indicesToRemove.append(far_indices[i + 1])
+        # distances[i] is the distance from the ith point to the (i + 1)st point, so the (i + 1)st point is far from both
+        # of its neighbors when both i and i + 1 are in far_indices.
+        indicesToRemove = list(far_indices[1:][np.diff(far_indices) == 1])
+
+        # The first point's neighbors are the second point and (wrapping around) the last point.
+        if (far_indices[0] == 0) and (far_indices[-1] == oldPoints.shape[0] - 1):
+            indicesToRemove.append(0)
 
         # Remove the extraneous points.
-        return deleteHelper(oldPoints, indicesToRemove)
+        keep = np.ones(oldPoints.shape[0], dtype = bool)
+        keep[indicesToRemove] = False
+        return oldPoints[keep]
     else:
         return oldPoints # Remove nothing in this case.
 
@@ -161,15 +263,15 @@ def pointDistances(points):
     The last entry is the distance from the last point to the first point.
     '''
 
-    numPts = points.shape[0]
-    distances = []
-    for i in range(0, numPts): # i covers the range {0, ..., numPts - 1} since numPts isn't included
-        if i == numPts - 1:  # If on last point, compare last point with first point
-            distances.append(np.linalg.norm(points[i, :] - points[0, :]))
-        else:
-            distances.append(np.linalg.norm(points[i + 1, :] - points[i, :]))
+    points = np.ascontiguousarray(points, dtype = np.float64)
+
+    if HAS_NUMBA and points.ndim == 2 and points.shape[1] == 2:
+        return _pointDistances2DJit(points)
 
-    return np.array(distances)
+    # Difference between each point and the next one, wrapping around from the last point to the first point.
+    diffs = np.roll(points, -1, axis = 0) - points
+
+    return np.sqrt(np.einsum('ij,ij->i', diffs, diffs))
 
 def deleteHelper(arr, indices, axis = 0):
     '''
@@ -180,7 +282,7 @@ def deleteHelper(arr, indices, axis = 0):
     '''
 
     def emptyNdarrayCheck(x):
-        return type(x) is np.ndarray and ((x == np.array(None)).any() or x.size == 0)
+        return type(x) is np.ndarray and x.size == 0
 
     def emptyListCheck(x):
         return type(x) is list and len(x) == 0
@@ -207,30 +309,71 @@ def sharedRows(arr1, arr2):
     '''
 
     if arr1 is None or arr1.size == 0 or arr2 is None or arr2.size == 0: #If either array is empty, return a list containing three empty ndarrays.
-        return[np.array([]), np.array([]), np.array([])]
+        noRows = np.empty((0,)) if arr1 is None else np.empty((0,) + arr1.shape[1:], dtype = arr1.dtype)
+        return [noRows, np.empty((0,), dtype = np.intp), np.empty((0,), dtype = np.intp)]
 
     if arr1.shape[1] != arr2.shape[1]:
         raise ValueError("Arrays must have same number of columns.")
 
-    # Get the indices of the shared rows.
-    sharedIndicesArr1 = []
-    sharedIndicesArr2 = []
+    # View each row as a single opaque (void) element so that rows can be compared (sorted and searched) in C, rather
+    # than comparing every row of arr1 with every row of arr2. Void elements are compared bytewise, which is much
+    # cheaper than comparing a structured element field by field. For floats, adding 0.0 turns -0.0 into 0.0 (without
+    # changing the dtype), so that rows that compare equal also have the same bytes.
+    dtype = np.result_type(arr1, arr2)
+    rows1 = np.ascontiguousarray(arr1, dtype = dtype)
+    rows2 = np.ascontiguousarray(arr2, dtype = dtype)
+    if np.issubdtype(dtype, np.inexact):
+        rows1 = rows1 + dtype.type(0)
+        rows2 = rows2 + dtype.type(0)
+    rowType = np.dtype((np.void, rows1.dtype.itemsize * rows1.shape[1]))
+    rows1 = rows1.view(rowType).ravel()
+    rows2 = rows2.view(rowType).ravel()
+
+    def findSharedRows(small, large):
+        # Sort only the smaller array and look up every row of the larger one in it. Like a row-by-row comparison that
+        # never reuses a row, the kth occurrence of a row in "small" is paired with its kth occurrence in "large".
+        # Returns the paired indices into "small" and "large".
+        sorter = np.argsort(small, kind = 'stable')
+        sortedSmall = small[sorter]
+
+        # pos is where each row of "large" would start in sortedSmall, i.e. the first occurrence of that row, if any.
+        pos = np.searchsorted(sortedSmall, large)
+        pos[pos == len(sortedSmall)] = 0
+        indicesLarge = np.flatnonzero(sortedSmall[pos] == large)
+        starts = pos[indicesLarge]
+
+        # Rank each matched row of "large" among the matched rows equal to it (in order of their index in "large").
+        # The sort is stable, so the occurrences of a row in sortedSmall are also in order of their index in "small".
+        order = np.argsort(starts, kind = 'stable')
+        sortedStarts = starts[order]
+        rank = np.empty_like(starts)
+        rank[order] = np.arange(len(sortedStarts)) - np.searchsorted(sortedStarts, sortedStarts)
+
+        # Keep the rows whose kth occurrence in "large" has a kth occurrence in "small" to pair with.
+        target = starts + rank
+        paired = target < len(sortedSmall)
+        paired[paired] = sortedSmall[target[paired]] == sortedSmall[starts[paired]]
+        return sorter[target[paired]], indicesLarge[paired]
+
+    if len(rows1) <= len(rows2):
+        sharedIndicesArr1, sharedIndicesArr2 = findSharedRows(rows1, rows2)
+    else:
+        sharedIndicesArr2, sharedIndicesArr1 = findSharedRows(rows2, rows1)
+
+    # NaN never compares equal, so rows containing NaN are not shared even when their bytes match.
+    if np.issubdtype(dtype, np.inexact):
+        noNaN = ~np.isnan(arr1[sharedIndicesArr1, :]).any(axis = 1)
+        sharedIndicesArr1 = sharedIndicesArr1[noNaN]
+        sharedIndicesArr2 = sharedIndicesArr2[noNaN]
 
-    for i in range(0, arr1.shape[0]):
-        for j in range(0, arr2.shape[0]):
-            if i in sharedIndicesArr1 or j in sharedIndicesArr2:
-                continue
-            elif np.all(arr1[i, :] == arr2[j, :]): #If (ith row in arr1) == (jth row in arr2)
-                sharedIndicesArr1.append(i)
-                sharedIndicesArr2.append(j)
+    # Sort the indices by their index in arr1.
+    order = np.argsort(sharedIndicesArr1)
+    sharedIndicesArr1 = sharedIndicesArr1[order]
+    sharedIndicesArr2 = sharedIndicesArr2[order]
 
     # Use these indices to build the matrix of shared rows.
     _sharedRows = arr1[sharedIndicesArr1, :]
 
-    # Convert the lists of sharedIndices to ndarrays.
-    sharedIndicesArr1 = np.array(sharedIndicesArr1)
-    sharedIndicesArr2 = np.array(sharedIndicesArr2)
-
     return [_sharedRows, sharedIndicesArr1, sharedIndicesArr2]
 
 def removeZerorows(arr):
@@ -249,12 +392,28 @@ def calcApex(epiPts1, epiPts2):
 
     _epiPts1 = removeZerorows(epiPts1)
     _epiPts2 = removeZerorows(epiPts2)
-    dist = cdist(_epiPts1, _epiPts2) # Compute pairwise distances.
-    apexIndex = np.unravel_index(np.argmin(dist), dist.shape)[0]
-    if apexIndex.shape != ():
-        apexIndex = apexIndex[0]
 
-    return epiPts1[apexIndex, :]
+    # For each point in _epiPts1, find the distance to its nearest point in _epiPts2.
+    tree = cKDTree(_epiPts2)
+    dist, _ = tree.query(_epiPts1, k = 1)
+    apexIndex = np.argmin(dist)
+
+    return _epiPts1[apexIndex, :]
+
+@lru_cache(maxsize = 8)
+def loadValveMatFiles(mat_file_stats):
+    '''
+    "mat_file_stats" is a tuple of (file name, modification time in ns, size) tuples, one per valve points .mat file.
+    Returns a tuple containing, for each file, the dict of valve point variables loaded from it. Only the valve point
+    variables are parsed. The result is cached for the most recently loaded sets of files; since the modification time
+    and size are part of the key, a rewritten file is loaded again.
+    '''
+
+    mat_filenames = [file for (file, _, _) in mat_file_stats]
+
+    # Reading and decompressing the files releases the GIL, so the files are loaded in parallel.
+    with ThreadPoolExecutor(max_workers = min(8, len(mat_filenames))) as executor:
+        return tuple(executor.map(lambda file: sio.loadmat(file, variable_names = VALVE_VARIABLE_NAMES), mat_filenames))
 
 def manuallyCompileValvePoints(fldr, numFrames, frameNum):
     '''
@@ -268,15 +427,23 @@ def manuallyCompileValvePoints(fldr, numFrames, frameNum):
     all be None.
     '''
 
+    # The folder is searched on every call (so files created later are found), but only the loading is cached.
     mat_filenames = glob(fldr + "valve-motion-predicted-LA_[0-9]CH.mat")
-    mat_files = [sio.loadmat(file) for file in mat_filenames]
+    mat_file_stats = tuple((file, stat.st_mtime_ns, stat.st_size) for (file, stat) in
+                           ((file, os.stat(file)) for file in mat_filenames))
+    mat_files = loadValveMatFiles(mat_file_stats) if len(mat_file_stats) > 0 else ()
 
     mv = np.zeros((len(mat_files), 2, 3))
     tv = np.zeros((2, 3))
     av = np.zeros((2, 3))
     pv = np.zeros((2, 3))
 
+    # Merge the variables of all files. If a variable is in more than one file, the first file that has it is used.
+    valve_vars = {}
     for i, file in enumerate(mat_files):
+        for var_name, value in file.items():
+            valve_vars.setdefault(var_name, value)
+
         # Load the variable point_coords_mv from the MATLAB file.
         point_coords_mv = file["point_coords_mv"]
 
@@ -285,16 +452,12 @@ def manuallyCompileValvePoints(fldr, numFrames, frameNum):
         mv[i, :, :] = tmp[frameNum, :, :]
 
     def get_interp_mat_var(mat_var):
-        var_name = "point_coords_" + mat_var
-        result = None
-        for file in mat_files:
-            if var_name in file:
-                point_coords_mat_var = file[var_name]
-                result = interpTime(point_coords_mat_var, numFrames)
-                result = np.squeeze(result[frameNum, :, :])
-                break
+        point_coords_mat_var = valve_vars.get("point_coords_" + mat_var)
+        if point_coords_mat_var is None:
+            return None
 
-        return result
+        result = interpTime(point_coords_mat_var, numFrames)
+        return np.squeeze(result[frameNum, :, :])
 
     # Return stuff.
     _tv = get_interp_mat_var("tv")
@@ -316,20 +479,35 @@ def interpTime(oldValvePts, newNumInterpSamples):
     Returns the new, interpolated valve positions.
     '''
 
-    result = np.zeros((newNumInterpSamples, oldValvePts.shape[1], oldValvePts.shape[2]))
+    # Treat each (i, j) entry as a separate time series, i.e. a column of a numTimes x numSeries array.
+    flat = oldValvePts.reshape(oldValvePts.shape[0], -1)
+    nonzero = flat != 0 # Zeros are missing samples and are not interpolated.
+    numSamples = np.count_nonzero(nonzero, axis = 0)
 
-    for i in range(0, oldValvePts.shape[1]):
-        for j in range(0, oldValvePts.shape[2]):
-            sampledValues = np.squeeze(oldValvePts[:, i, j])
-            sampledValues = deleteHelper(sampledValues, sampledValues == 0, axis = 0) # Remove all zeros from sampledValues
-            if sampledValues.size != 0:
-                samplePts = np.linspace(1, 100, len(sampledValues))
-                queryPts = np.linspace(1, 100, newNumInterpSamples)
-                result[:, i, j] = np.interp(queryPts, samplePts, sampledValues) # note, np.interp() gives slightly different results than MATLAB's interp1d()
-            else:
-                result[:, i, j] = np.zeros(newNumInterpSamples, 1)
+    result = np.zeros((newNumInterpSamples, flat.shape[1]))
+
+    # Series with the same number of samples share the same sample points, so they can be interpolated together.
+    # Series with no samples are left as zeros.
+    for count in np.unique(numSamples[numSamples > 0]):
+        cols = np.flatnonzero(numSamples == count)
+        if count == flat.shape[0]: # No missing samples (the common case).
+            sampledValues = flat[:, cols]
+        else:
+            sampledValues = flat[:, cols].T[nonzero[:, cols].T].reshape(len(cols), count).T
 
-    return result
+        if count == 1:
+            result[:, cols] = sampledValues
+            continue
+
+        # The samples and the queries are both evenly spaced over the same interval, so this is a linear resampling:
+        # each query point lies between samples i0 and i0 + 1, at a fraction w of the way from one to the other.
+        # (Note, this gives slightly different results than MATLAB's interp1d()).
+        queryPos = np.linspace(0, count - 1, newNumInterpSamples)
+        i0 = np.minimum(queryPos.astype(np.intp), count - 2)
+        w = (queryPos - i0)[:, None]
+        result[:, cols] = sampledValues[i0] * (1 - w) + sampledValues[i0 + 1] * w
+
+    return result.reshape((newNumInterpSamples,) + oldValvePts.shape[1:])
 
 
 def calculate_area_of_polygon_3d(points, normal):
@@ -338,7 +516,8 @@ def calculate_area_of_polygon_3d(points, normal):
     v2 = np.cross(normal, v1)
     v2 = v2 / np.linalg.norm(v2)
     v1 = np.cross(v2, normal)
-    v1 = v1 / np.linalg.norm(v1)
+    if abs(np.dot(normal, normal) - 1) > 1e-9: # If normal is a unit vector, v1 is already a unit vector.
+        v1 = v1 / np.linalg.norm(v1)
 
     # Define rotation matrix
     R = np.array([v1, v2, normal])
@@ -347,10 +526,6 @@ def calculate_area_of_polygon_3d(points, normal):
     centroid = np.mean(points, axis=0)
     polygon = np.dot(points-centroid, R.T)[:, :2]
 
-    # Compute the area of the polygon
-    area = Polygon(polygon).area
-
-    def PolyArea(x,y):
-        return 0.5*np.abs(np.dot(x,np.roll(y,1))-np.dot(y,np.roll(x,1)))
-
-    return area
\ No newline at end of file
+    # Compute the area of the polygon using the shoelace formula
+    x, y = polygon[:, 0], polygon[:, 1]
+    return 0.5*np.abs(np.dot(x, np.roll(y, 1)) - np.dot(y, np.roll(x, 1)))